@@ -0,0 +1,134 @@
+"""
+Title: ad_prefilter
+Description: Cheap first-pass filter for spotify-ad-mute's template matching.
+             Compares a handful of a template's pixels (on its strokes and in
+             the gaps between them) with the screenshot at every position
+             (sum of absolute differences, SAD, after removing each side's
+             mean and scaling to the template's contrast, so brightness and
+             contrast changes don't matter), so full normalised correlation
+             only runs where those pixels line up.
+Author: MANGOBA
+"""
+
+import numpy as np
+from numba import njit
+
+
+def _spread(pool: np.ndarray, wanted: int) -> list[tuple[int, int]]:
+    """Pick `wanted` (x, y) points from `pool`, each as far as possible from those already picked."""
+    if len(pool) == 0:
+        return []
+    picked = [pool[0]]
+    dist = np.abs(pool - pool[0]).sum(axis=1)
+    while len(picked) < min(wanted, len(pool)):
+        i = int(np.argmax(dist))
+        picked.append(pool[i])
+        dist = np.minimum(dist, np.abs(pool - pool[i]).sum(axis=1))
+    return [(int(x), int(y)) for x, y in picked]
+
+
+def select_samples(template: np.ndarray, count: int = 8) -> tuple[np.ndarray, np.ndarray]:
+    """Pick `count` pixels of a grayscale template: half on its strokes, half in the gaps between them.
+
+    The template's median is taken as its background; strokes are the pixels
+    furthest from it. Background pixels with strokes on several sides (letter
+    gaps and counters) are preferred over the template's empty margin, since
+    they tell text apart from solid blocks and from other text. Both halves
+    are spread over the template. Returns (points, values): an int32 (count, 2)
+    array of (x, y) offsets and the int32 pixel values there.
+    """
+    contrast = np.abs(template.astype(np.int32) - int(np.median(template)))
+    h, w = template.shape
+    strokes = contrast >= max(1, contrast.max() * 3 // 4)
+    padded = np.pad(strokes, 1).astype(np.int32)
+    neighbours = sum(padded[dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3))
+    background = contrast <= contrast.max() // 4
+    gaps = background & (neighbours >= 3)
+    if np.count_nonzero(gaps) < count // 2:
+        gaps = background & (neighbours > 0)
+    if np.count_nonzero(gaps) < count // 2:
+        gaps = background
+
+    def pool(mask: np.ndarray) -> np.ndarray:
+        ys, xs = np.nonzero(mask)
+        return np.stack([xs, ys], axis=1)
+
+    points = _spread(pool(strokes), count - count // 2) + _spread(pool(gaps), count // 2)
+    xy = np.array(points, dtype=np.int32).reshape(-1, 2)
+    values = template[xy[:, 1], xy[:, 0]].astype(np.int32)
+    return xy, values
+
+
+# Serial and nogil: spotify-ad-mute's match pool already runs one template per
+# thread, so the kernel runs concurrently without a parallel numba layer.
+@njit(nogil=True, cache=True)
+def _candidate_mask(flat, stride, rows, cols, offsets, values, thresh, max_count):
+    count = offsets.shape[0]
+    # Everything is scaled by `count` so the mean removal stays in integers
+    centred = values.astype(np.int64) * count - values.sum()
+    spread = np.abs(centred).sum()
+    # Quick ordering check first: the window's pixel at the template's brightest
+    # sample must be brighter than at its darkest. Flat areas and most of a
+    # text-heavy screen fail it after two reads.
+    bright = offsets[np.argmax(values)]
+    dark = offsets[np.argmin(values)]
+    mask = np.zeros((rows, cols), dtype=np.bool_)
+    pixels = np.empty(count, dtype=np.int64)
+    hits = 0
+    for y in range(rows):
+        base = y * stride
+        for x in range(cols):
+            p = base + x
+            if flat[p + bright] <= flat[p + dark]:
+                continue
+            total = 0
+            for i in range(count):
+                pixels[i] = flat[p + offsets[i]]
+                total += pixels[i]
+            window_spread = 0
+            for i in range(count):
+                pixels[i] = pixels[i] * count - total
+                window_spread += abs(pixels[i])
+            if window_spread < count * count:
+                continue  # flat to within a grey level: normalised correlation scores it 0
+            # Compare after scaling the window's samples to the template's spread,
+            # multiplied through by window_spread to stay in integers
+            limit = thresh * count * window_spread
+            sad = 0
+            for i in range(count):
+                sad += abs(pixels[i] * spread - centred[i] * window_spread)
+                if sad > limit:
+                    break
+            if sad <= limit:
+                mask[y, x] = True
+                hits += 1
+                if hits > max_count:
+                    return mask, hits  # too many to be worth listing; stop scanning
+    return mask, hits
+
+
+def candidates(haystack_u8: np.ndarray, points: np.ndarray, values: np.ndarray,
+               tpl_w: int, tpl_h: int, thresh: int, max_count: int) -> list[tuple[int, int]] | None:
+    """Return top-left (x, y) positions where the sample pixels' normalised SAD is <= thresh.
+
+    The samples are compared after removing each side's mean and scaling the
+    window's spread to the template's, so like normalised correlation the test
+    ignores brightness and contrast changes; `thresh` is in template grey levels.
+    Returns None as soon as more than `max_count` positions pass.
+    """
+    if haystack_u8.shape[0] < tpl_h or haystack_u8.shape[1] < tpl_w:
+        return []
+    haystack_u8 = np.ascontiguousarray(haystack_u8)  # a no-op for screenshots
+    stride = haystack_u8.shape[1]
+    offsets = points[:, 1].astype(np.int64) * stride + points[:, 0]
+    mask, hits = _candidate_mask(haystack_u8.ravel(), stride, haystack_u8.shape[0] - tpl_h + 1,
+                                 haystack_u8.shape[1] - tpl_w + 1, offsets, values, thresh, max_count)
+    if hits > max_count:
+        return None
+    ys, xs = np.nonzero(mask)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+# Compile once at import rather than during the first scan.
+candidates(np.zeros((2, 2), dtype=np.uint8), np.zeros((1, 2), dtype=np.int32),
+           np.zeros(1, dtype=np.int32), 1, 1, 0, 0)
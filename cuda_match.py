@@ -0,0 +1,57 @@
+"""
+Title: cuda_match
+Description: GPU template matching for spotify-ad-mute. With an OpenCV build
+             that has CUDA support and an NVIDIA GPU present, the ad images are
+             uploaded once at startup, each screenshot is uploaded once per
+             scan, and every template is matched on its own CUDA stream; only
+             the best score and its location come back to the CPU.
+             Importing this module raises ImportError when no CUDA device is
+             usable, so callers can treat it like any other optional dependency.
+Author: MANGOBA
+"""
+
+import cv2
+import numpy as np
+
+try:
+    _DEVICES = cv2.cuda.getCudaEnabledDeviceCount()
+except (AttributeError, cv2.error):  # OpenCV built without the cuda module
+    _DEVICES = 0
+if _DEVICES < 1:
+    raise ImportError("no CUDA-enabled device available to OpenCV")
+
+
+class CudaMatcher:
+    """TM_CCOEFF_NORMED matcher for a fixed list of grayscale uint8 templates."""
+
+    def __init__(self, templates: list[np.ndarray]):
+        # One matcher per stream: each keeps its own scratch buffers (template
+        # copy, spectra, integrals), which concurrent streams must not share
+        self._matchers = [cv2.cuda.createTemplateMatching(cv2.CV_8UC1, cv2.TM_CCOEFF_NORMED)
+                          for _ in templates]
+        self._shapes = [t.shape for t in templates]
+        self._templates = []
+        for t in templates:
+            gpu_tpl = cv2.cuda_GpuMat()
+            gpu_tpl.upload(np.ascontiguousarray(t, dtype=np.uint8))
+            self._templates.append(gpu_tpl)
+        self._streams = [cv2.cuda_Stream() for _ in templates]
+        self._results = [cv2.cuda_GpuMat() for _ in templates]  # reused between scans
+        self._haystack = cv2.cuda_GpuMat()
+
+    def match(self, haystack: np.ndarray) -> list[tuple[float, tuple[int, int]]]:
+        """Return the best (score, top-left (x, y)) per template, -1 where it doesn't fit."""
+        hay_h, hay_w = haystack.shape
+        self._haystack.upload(haystack)
+        queued = []
+        for i, (h, w) in enumerate(self._shapes):
+            if h <= hay_h and w <= hay_w:
+                self._matchers[i].match(self._haystack, self._templates[i], self._results[i],
+                                        stream=self._streams[i])
+                queued.append(i)
+        matches: list[tuple[float, tuple[int, int]]] = [(-1.0, (0, 0))] * len(self._shapes)
+        for i in queued:
+            self._streams[i].waitForCompletion()
+            _, max_val, _, max_loc = cv2.cuda.minMaxLoc(self._results[i])
+            matches[i] = max_val, max_loc
+        return matches
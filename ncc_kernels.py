@@ -0,0 +1,174 @@
+"""
+Title: ncc_kernels
+Description: Shape-specialised normalised cross-correlation kernels for
+             spotify-ad-mute. The ad/volume images are known at startup, so a C
+             kernel with each template's width and height hard-coded is
+             generated and compiled with cffi; the fixed loop bounds let the C
+             compiler unroll and vectorise the inner loops. Used for the small
+             verification windows around candidate matches, where a generic
+             cv2.matchTemplate call is dominated by per-call overhead.
+             Compiling runs on a background thread, so it doesn't hold up
+             startup; until it finishes the kernels return None.
+Author: MANGOBA
+"""
+
+import os
+import hashlib
+import logging
+import importlib.machinery
+import importlib.util
+from threading import Thread
+from typing import Callable
+
+import numpy as np
+from cffi import FFI
+
+log = logging.getLogger(__name__)
+
+# Compiled modules are cached per user and reused while the template sizes don't
+# change (the file name carries a hash of them).
+if os.name == 'nt':
+    _CACHE_ROOT = os.environ.get('LOCALAPPDATA') or os.path.expanduser(r'~\AppData\Local')
+else:
+    _CACHE_ROOT = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+CACHE_DIR = os.path.join(_CACHE_ROOT, 'spotify-ad-mute', 'ncc')
+
+_PROTOTYPE = ("double match_{w}x{h}(const unsigned char *img, long stride, int rows, int cols,"
+              " const unsigned char *tpl, double tpl_sum, double tpl_var, int *xy);")
+
+_KERNEL = r"""
+double match_{w}x{h}(const unsigned char *img, long stride, int rows, int cols,
+                     const unsigned char *tpl, double tpl_sum, double tpl_var, int *xy)
+{{
+    /* TM_CCOEFF_NORMED over rows x cols positions for a {w}x{h} template:
+       (sum(I*T) - sum(I)*sum(T)/n) / sqrt(var(I)*n * var(T)*n) */
+    const double n = {n}.0;
+    double best = -2.0;
+    xy[0] = 0;
+    xy[1] = 0;
+    for (int y = 0; y < rows; y++) {{
+        for (int x = 0; x < cols; x++) {{
+            const unsigned char *p = img + y * stride + x;
+            unsigned long long s = 0, ss = 0, st = 0;
+            for (int j = 0; j < {h}; j++) {{
+                const unsigned char *row = p + j * stride;
+                const unsigned char *trow = tpl + j * {w};
+                unsigned int rs = 0, rss = 0, rst = 0;
+                for (int i = 0; i < {w}; i++) {{
+                    unsigned int v = row[i];
+                    rs += v;
+                    rss += v * v;
+                    rst += v * trow[i];
+                }}
+                s += rs;
+                ss += rss;
+                st += rst;
+            }}
+            double var = (double)ss - (double)s * (double)s / n;
+            double score = 0.0;
+            if (var > 1e-6 && tpl_var > 1e-6)
+                score = ((double)st - (double)s * tpl_sum / n) / sqrt(var * tpl_var);
+            if (score > best) {{
+                best = score;
+                xy[0] = x;
+                xy[1] = y;
+            }}
+        }}
+    }}
+    return best;
+}}
+"""
+
+
+def _load_extension(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _compiled_module(shapes: list[tuple[int, int]]):
+    """Return the cffi extension module with one kernel per (w, h), compiling it if not cached."""
+    source = '#include <math.h>\n' + ''.join(_KERNEL.format(w=w, h=h, n=w * h) for w, h in shapes)
+    name = '_ncc_' + hashlib.sha1(source.encode()).hexdigest()[:12]
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        path = os.path.join(CACHE_DIR, name + suffix)
+        if os.path.exists(path):
+            try:
+                return _load_extension(name, path)
+            except Exception as exc:  # corrupt or built for another Python/compiler
+                log.warning("Cached NCC kernels '%s' failed to load, rebuilding: %s", path, exc)
+                os.remove(path)
+
+    ffi = FFI()
+    ffi.cdef('\n'.join(_PROTOTYPE.format(w=w, h=h) for w, h in shapes))
+    ffi.set_source(name, source, extra_compile_args=['/O2'] if os.name == 'nt' else ['-O3'])
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = ffi.compile(tmpdir=CACHE_DIR)
+    return _load_extension(name, path)
+
+
+class _Kernel:
+    """Window matcher for one template; returns None until the compiled module is loaded."""
+
+    def __init__(self, template: np.ndarray, builder: '_Builder'):
+        self._template = template
+        self._builder = builder
+        self._match: Callable | None = None
+
+    def __call__(self, window: np.ndarray) -> tuple[float, tuple[int, int]] | None:
+        if self._match is None:
+            if self._builder.module is None:
+                return None
+            self._match = _bind(self._builder.module, self._template)
+        return self._match(window)
+
+
+class _Builder(Thread):
+    """Compiles (or loads the cached) kernel module in the background."""
+
+    def __init__(self, shapes: list[tuple[int, int]]):
+        super().__init__(daemon=True, name='ncc-build')
+        self._shapes = shapes
+        self.module = None
+
+    def run(self):
+        try:
+            self.module = _compiled_module(self._shapes)
+        except Exception as exc:  # no compiler, cffi build failure, ...
+            log.warning("NCC kernels unavailable, using OpenCV only: %s", exc)
+
+
+def build(templates: list[np.ndarray]) -> list[Callable]:
+    """Start compiling kernels for the given grayscale uint8 templates.
+
+    Returns at once, per template, a function taking a uint8 image window (any
+    row stride, at least template-sized) and returning the best
+    (score, top-left (x, y)) inside it — or None while the kernels are still
+    compiling, or for good if no C compiler is available.
+    """
+    builder = _Builder(sorted({(t.shape[1], t.shape[0]) for t in templates}))
+    builder.start()
+    return [_Kernel(t, builder) for t in templates]
+
+
+def _bind(module, template: np.ndarray) -> Callable:
+    ffi, lib = module.ffi, module.lib
+    h, w = template.shape
+    kernel = getattr(lib, f'match_{w}x{h}')
+    tpl = np.ascontiguousarray(template, dtype=np.uint8)
+    tpl_ptr = ffi.cast('const unsigned char *', tpl.ctypes.data)
+    tpl_sum = float(tpl.sum(dtype=np.float64))
+    tpl_var = float(np.square(tpl, dtype=np.float64).sum()) - tpl_sum * tpl_sum / tpl.size
+
+    def match(window: np.ndarray) -> tuple[float, tuple[int, int]]:
+        if window.dtype != np.uint8 or window.strides[1] != 1:
+            window = np.ascontiguousarray(window, dtype=np.uint8)
+        rows, cols = window.shape[0] - h + 1, window.shape[1] - w + 1
+        xy = ffi.new('int[2]')
+        img_ptr = ffi.cast('const unsigned char *', window.ctypes.data)
+        score = kernel(img_ptr, window.strides[0], rows, cols, tpl_ptr, tpl_sum, tpl_var, xy)
+        return score, (xy[0], xy[1])
+
+    match.template = tpl  # keep the buffer behind tpl_ptr alive
+    return match
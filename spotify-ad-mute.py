@@ -9,16 +9,66 @@ try:
     import os
     import sys
     import time
+    import asyncio
+    import ctypes
+    from ctypes import wintypes
     import logging
     from pathlib import Path
-    from threading import Thread
-    from pyautogui import locateCenterOnScreen, click as pyautogui_click
+    from threading import Thread, Event, Lock, local
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from typing import Callable, NamedTuple
+    import cv2
+    import mss
+    import numpy as np
+    import psutil
+    import win32gui
+    import win32process
+    from pyautogui import click as pyautogui_click
     from pick import pick
-    from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
+    from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume, IAudioMeterInformation
+    from pycaw.callbacks import AudioSessionEvents
+    from comtypes import COMError
 except ImportError as details:
     print("-E- Couldn't import module, try pip install 'module'")
     raise details
 
+# Optional: Windows media metadata (pip install winrt-Windows.Media.Control).
+# Without it, ads are only detected by scanning the screen.
+try:
+    from winrt.windows.media.control import (
+        GlobalSystemMediaTransportControlsSessionManager as MediaSessionManager,
+    )
+except ImportError:
+    MediaSessionManager = None
+
+# Optional: shape-specialised C kernels for small match windows (pip install cffi,
+# plus a C compiler such as the MSVC Build Tools). Without them OpenCV is used.
+try:
+    import ncc_kernels
+except ImportError:
+    ncc_kernels = None
+
+# Optional: perceptual hashing to drop near-duplicate ad images (pip install ImageHash).
+# Without it, only byte-identical ad images are merged.
+try:
+    import imagehash
+    from PIL import Image
+except ImportError:
+    imagehash = None
+
+# Optional: GPU template matching (needs an OpenCV build with CUDA support and an
+# NVIDIA GPU; the pip opencv-python wheels have no CUDA). Without it, matching runs on the CPU.
+try:
+    import cuda_match
+except ImportError:
+    cuda_match = None
+
+# Optional: numba-compiled prefilter for full-resolution matching (pip install numba).
+try:
+    import ad_prefilter
+except ImportError:
+    ad_prefilter = None
+
 
 # --- Logging setup ---
 logging.basicConfig(
@@ -41,8 +91,56 @@ DEBUG_LOGGING = False
 # remote desktop sessions where pycaw only affects the local audio session.
 USE_PYCAW = True
 
+# Set to True to detect ads from the track info Spotify reports to Windows
+# (title/artist) and its audio level, skipping the screen scan when that is
+# conclusive. Needs the optional winrt package; falls back to the screen scan.
+USE_MEDIA_METADATA = True
+
 log.setLevel(logging.DEBUG if DEBUG_LOGGING else logging.INFO)
 
+# Minimum normalised correlation score for a template to count as found on screen.
+MATCH_CONFIDENCE = 0.9
+
+# Coarse-to-fine matching: templates and screenshots are halved up to
+# PYRAMID_LEVELS times with cv2.pyrDown. The coarsest level at which a template
+# is still at least PYRAMID_MIN_SIZE pixels on each side is searched first, then
+# the best COARSE_CANDIDATES peaks scoring at least COARSE_CONFIDENCE are verified
+# at full resolution against MATCH_CONFIDENCE.
+PYRAMID_LEVELS = 2
+PYRAMID_MIN_SIZE = 6
+COARSE_CONFIDENCE = 0.8
+COARSE_CANDIDATES = 3
+
+# Full-resolution prefilter (needs numba): PREFILTER_SAMPLES pixels of each
+# template (half on its strokes, half in the gaps between them) are compared at
+# every position first, with brightness and contrast normalised out, and only
+# positions within PREFILTER_TOLERANCE grey levels per pixel get a full match.
+# If more than PREFILTER_MAX_CANDIDATES positions pass, the pyramid search is used.
+PREFILTER_SAMPLES = 12
+PREFILTER_TOLERANCE = 16
+PREFILTER_MAX_CANDIDATES = 64
+
+# Set to True to correlate all ad images against a single FFT of the screenshot
+# instead of matching them one by one. Off by default: with the pyramid search
+# and prefilter the one-by-one path was 1.6-4x faster in every case measured
+# (3-10 ad images of 20x70 to 100x300 pixels, half-HD and 1080p captures).
+USE_FFT_MATCHING = False
+
+# GPU matching (needs cuda_match): used when a CUDA device is found and the scan
+# is big enough to pay for the upload, i.e. ad images x screenshot pixels is at
+# least GPU_MIN_WORK (about 4 ad images on a 1080p capture). Set USE_GPU to False
+# to always match on the CPU.
+USE_GPU = True
+GPU_MIN_WORK = 8_000_000
+
+# Compiled ncc_kernels matchers are only used for windows with at most this
+# many candidate positions; for larger windows cv2.matchTemplate is faster.
+NCC_KERNEL_MAX_POSITIONS = 64
+
+# Ad images of the same size whose perceptual hashes differ by at most this
+# many bits are treated as captures of the same ad; only one is matched.
+PHASH_MAX_DISTANCE = 4
+
 
 # --- Path helpers ---
 
@@ -52,9 +150,78 @@ def resource_path(relative_path: str) -> Path:
     return base_path / relative_path
 
 
-def collect_ad_images(folder: Path) -> list[Path]:
-    """Return all PNG/JPG images found in the given ads folder."""
-    images = [p for p in folder.iterdir() if p.suffix.lower() in {'.png', '.jpg', '.jpeg'}]
+def build_pyramid(image: np.ndarray, levels: int) -> tuple[np.ndarray, ...]:
+    """Return (image, image/2, image/4, ...) with `levels` pyrDown steps."""
+    pyramid = [image]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return tuple(pyramid)
+
+
+def template_stats(image: np.ndarray) -> tuple[float, float]:
+    """Return a template's (mean, L2 norm of image - mean), computed once at load."""
+    pixels = image.astype(np.float64)
+    mean = float(pixels.mean())
+    return mean, float(np.sqrt(np.square(pixels - mean).sum()))
+
+
+class CoarsePhase(NamedTuple):
+    """A template downsampled after cropping `dx`/`dy` pixels off its top-left."""
+    dx: int
+    dy: int
+    image: np.ndarray
+    stats: tuple[float, float]  # template_stats(image)
+
+
+def build_coarse_phases(image: np.ndarray) -> tuple[int, tuple[CoarsePhase, ...]]:
+    """Pick the coarsest usable pyramid level for a template and downsample it.
+
+    A screenshot is only downsampled once, so the template can line up with its
+    2x2 (4x4, ...) grid in any of scale*scale ways; small UI text matches poorly
+    when that alignment is off. One pre-cropped variant is kept per alignment.
+    Returns (level, phases); level 0 means the template is too small to downsample.
+    """
+    for level in range(PYRAMID_LEVELS, 0, -1):
+        scale = 1 << level
+        if min(image.shape) - (scale - 1) < PYRAMID_MIN_SIZE * scale:
+            continue
+        phases = []
+        for dy in range(scale):
+            for dx in range(scale):
+                coarse = np.ascontiguousarray(build_pyramid(image[dy:, dx:], level)[-1])
+                phases.append(CoarsePhase(dx, dy, coarse, template_stats(coarse)))
+        return level, tuple(phases)
+    return 0, ()
+
+
+class Template(NamedTuple):
+    """A reference image decoded once at startup, ready to be matched on screen."""
+    name: str
+    image: np.ndarray  # grayscale uint8
+    level: int  # pyramid level searched first (0 = full resolution only)
+    phases: tuple[CoarsePhase, ...]  # downsampled variants at `level`
+    samples: tuple[np.ndarray, np.ndarray] | None  # prefilter (points, values), None without numba
+    stats: tuple[float, float]  # template_stats(image)
+    kernel: Callable | None = None  # ncc_kernels window matcher (None until compiled), None without cffi
+
+
+def load_template(path: str | Path) -> Template | None:
+    """Decode an image file into a grayscale Template. Returns None if unreadable."""
+    image = cv2.imread(os.fspath(path), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        log.warning("Could not read image '%s'", path)
+        return None
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    samples = ad_prefilter.select_samples(image, PREFILTER_SAMPLES) if ad_prefilter is not None else None
+    return Template(os.path.basename(path), image, *build_coarse_phases(image), samples, template_stats(image))
+
+
+def collect_ad_images(folder: Path) -> list[Template]:
+    """Decode all PNG/JPG images found in the given ads folder, in name order."""
+    with os.scandir(folder) as entries:
+        paths = sorted(e.path for e in entries
+                       if e.name.lower().endswith(('.png', '.jpg', '.jpeg')) and e.is_file())
+    images = [t for t in map(load_template, paths) if t is not None]
     if not images:
         log.warning("No ad images found in '%s'", folder)
     else:
@@ -62,25 +229,171 @@ def collect_ad_images(folder: Path) -> list[Path]:
     return images
 
 
-image_volume: Path = resource_path('volume/volume.png')
-image_mute:   Path = resource_path('volume/mute.png')
-image_ads:   list[Path] = collect_ad_images(resource_path('ads'))
+def with_ncc_kernels(templates: list[Template | None]) -> list[Template | None]:
+    """Attach ncc_kernels window matchers to the templates (None entries pass through).
+
+    They compile in the background; until then _window_match() uses OpenCV.
+    """
+    loaded = [t for t in templates if t is not None]
+    if ncc_kernels is None or not loaded:
+        return templates
+    kernels = iter(ncc_kernels.build([t.image for t in loaded]))
+    return [t._replace(kernel=next(kernels)) if t is not None else None for t in templates]
+
+
+def dedupe_templates(templates: list[Template]) -> list[Template]:
+    """Return one representative per group of identical or near-identical templates.
+
+    Byte-identical images are always merged. With imagehash installed, images of
+    the same size whose pHashes are within PHASH_MAX_DISTANCE bits are grouped
+    too, keeping the group's medoid (the member closest to all the others).
+    """
+    unique: dict[tuple[tuple[int, ...], bytes], Template] = {}
+    for t in templates:
+        unique.setdefault((t.image.shape, t.image.tobytes()), t)
+    reps = list(unique.values())
+    if imagehash is None:
+        return reps
+
+    hashes = [imagehash.phash(Image.fromarray(t.image)) for t in reps]
+    groups: list[list[int]] = []
+    for i, t in enumerate(reps):
+        for group in groups:
+            first = group[0]
+            if reps[first].image.shape == t.image.shape and hashes[first] - hashes[i] <= PHASH_MAX_DISTANCE:
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+    return [reps[min(group, key=lambda i: sum(hashes[i] - hashes[j] for j in group))] for group in groups]
+
+
+image_volume: Template | None = load_template(resource_path('volume/volume.png'))
+image_mute:   Template | None = load_template(resource_path('volume/mute.png'))
+image_ads:   list[Template] = collect_ad_images(resource_path('ads'))
+image_volume, image_mute, *image_ads = with_ncc_kernels([image_volume, image_mute, *image_ads])
+image_ads_dedup: list[Template] = dedupe_templates(image_ads)
+if image_ads:
+    log.info("Matching %d of %d ad image(s) after removing duplicates (%.0f%%)",
+             len(image_ads_dedup), len(image_ads), 100 * len(image_ads_dedup) / len(image_ads))
 
 
 # --- Audio control ---
 
+class _SpotifySessionEvents(AudioSessionEvents):
+    """Drops the cached Spotify session as soon as Windows reports it gone."""
+
+    def __init__(self, session):
+        super().__init__()
+        self._session = session
+
+    def on_state_changed(self, new_state, new_state_id):
+        log.debug("Spotify audio session state: %s", new_state)
+        if new_state == "Expired":
+            _forget_spotify_session(self._session)
+
+    def on_session_disconnected(self, disconnect_reason, disconnect_reason_id):
+        log.debug("Spotify audio session disconnected: %s", disconnect_reason)
+        _forget_spotify_session(self._session)
+
+
+# Spotify's audio session and its volume interface, found once and reused
+# until the session expires or a COM call on it fails.
+_spotify_session = None
+_spotify_volume: ISimpleAudioVolume | None = None
+# The session whose events are registered; it can outlive the cache entry above.
+_notified_session = None
+
+
+def _forget_spotify_session(session=None):
+    """Drop the cached session — only if it is still `session`, when one is given."""
+    global _spotify_session, _spotify_volume
+    if session is not None and session is not _spotify_session:
+        return  # a stale session's late event; the current cache is still valid
+    _spotify_session = None
+    _spotify_volume = None
+
+
+def get_spotify_session():
+    """Return Spotify's pycaw AudioSession, enumerating sessions only when not cached."""
+    global _spotify_session, _notified_session
+    if _spotify_session is not None:
+        return _spotify_session
+    for session in AudioUtilities.GetAllSessions():
+        if session.Process and session.Process.name().lower() == 'spotify.exe':
+            # Unregister here rather than in the event callbacks, where
+            # WASAPI forbids it (it can deadlock)
+            if _notified_session is not None:
+                try:
+                    _notified_session.unregister_notification()
+                except Exception as exc:
+                    log.debug("Could not unregister old Spotify session events: %s", exc)
+                _notified_session = None
+            try:
+                session.register_notification(_SpotifySessionEvents(session))
+                _notified_session = session
+            except Exception as exc:
+                log.debug("Could not register Spotify session events: %s", exc)
+            _spotify_session = session
+            return session
+    return None
+
+
+def _get_spotify_volume() -> ISimpleAudioVolume | None:
+    """Return Spotify's cached ISimpleAudioVolume, looking it up only when not cached."""
+    global _spotify_volume
+    if _spotify_volume is None:
+        session = get_spotify_session()
+        if session is not None:
+            _spotify_volume = session.SimpleAudioVolume
+    return _spotify_volume
+
+
+def get_spotify_peak() -> float | None:
+    """Return Spotify's current audio peak level (0.0-1.0), or None if no session."""
+    session = get_spotify_session()
+    if session is None:
+        return None
+    try:
+        meter = session._ctl.QueryInterface(IAudioMeterInformation)
+        return meter.GetPeakValue()
+    except COMError as exc:
+        log.debug("Could not read Spotify peak level: %s", exc)
+        _forget_spotify_session()
+        return None
+
+
+def get_spotify_mute() -> bool | None:
+    """Return whether Spotify's audio session is muted, or None if no session."""
+    volume = _get_spotify_volume()
+    if volume is None:
+        return None
+    try:
+        return bool(volume.GetMute())
+    except COMError as exc:
+        log.debug("Could not read Spotify mute state: %s", exc)
+        _forget_spotify_session()
+        return None
+
+
 def _mute_via_pycaw(muted: bool) -> bool:
     """Mute or unmute Spotify via the Windows Core Audio API.
 
     Returns True if the Spotify session was found and updated.
     """
-    sessions = AudioUtilities.GetAllSessions()
-    for session in sessions:
-        if session.Process and session.Process.name().lower() == 'spotify.exe':
-            volume: ISimpleAudioVolume = session.SimpleAudioVolume
+    for attempt in range(2):
+        volume = _get_spotify_volume()
+        if volume is None:
+            break
+        try:
             volume.SetMute(muted, None)
-            log.info("Spotify %s (pycaw)", "muted" if muted else "unmuted")
-            return True
+        except COMError as exc:
+            # Session died (e.g. Spotify restarted) — drop the cache and look it up again
+            log.debug("SetMute failed on cached Spotify session (attempt %d): %s", attempt + 1, exc)
+            _forget_spotify_session()
+            continue
+        log.info("Spotify %s (pycaw)", "muted" if muted else "unmuted")
+        return True
     log.warning("Spotify process not found; could not %s", "mute" if muted else "unmute")
     return False
 
@@ -95,7 +408,7 @@ def _mute_via_click(muted: bool) -> bool:
     # If we want to unmute, Spotify must currently be muted — look for mute icon.
     target_image = image_volume if muted else image_mute
     target_label = "volume" if muted else "mute"
-    pos = locate_image(target_image)
+    pos = locate_in(grab_screen(), target_image)
     if pos is not None:
         pyautogui_click(x=pos[0], y=pos[1], clicks=1, button='left')
         log.info("Spotify %s (clicked %s icon at %s)", "muted" if muted else "unmuted", target_label, pos)
@@ -112,37 +425,562 @@ def set_spotify_mute(muted: bool) -> bool:
         return _mute_via_click(muted)
 
 
-# --- Screen detection ---
+# --- Media metadata ---
+
+# Titles Spotify reports to Windows while an ad plays (lower case). It also
+# reports its own name while paused, so these alone are not conclusive.
+AD_MEDIA_TITLES = {'advertisement', 'spotify', 'spotify free', ''}
+
+# Peak level below which Spotify is considered silent.
+SILENCE_PEAK = 1e-4
+
+_media_manager = None
+
 
-def locate_image(image: Path):
-    """Locate an image on screen. Returns center (x, y) or None."""
+async def _read_spotify_media() -> tuple[str, str, str] | None:
+    """Return (title, artist, album) of Spotify's media session, or None if not found."""
+    global _media_manager
+    if _media_manager is None:
+        _media_manager = await MediaSessionManager.request_async()
+    for session in _media_manager.get_sessions():
+        if 'spotify' in session.source_app_user_model_id.lower():
+            props = await session.try_get_media_properties_async()
+            return props.title or '', props.artist or '', props.album_title or ''
+    return None
+
+
+def get_spotify_media() -> tuple[str, str, str] | None:
+    """Synchronous wrapper around _read_spotify_media(); None if unavailable."""
+    if MediaSessionManager is None:
+        return None
     try:
-        return locateCenterOnScreen(str(image), grayscale=True, confidence=0.9)
+        return asyncio.run(_read_spotify_media())
     except Exception as exc:
-        log.debug("locate_image failed for '%s': %s", image.name, exc)
+        log.debug("Could not read Spotify media info: %s", exc)
         return None
 
 
-def is_muted_on_screen() -> bool | None:
+def check_for_ad_metadata() -> bool | None:
+    """Decide from media metadata and audio level whether an ad is playing.
+
+    Returns True (ad), False (music) or None when inconclusive — e.g. winrt is
+    missing, Spotify is paused, or it is muted — so the caller scans the screen.
+    Only a full track tag (artist and album) counts as music: ads can carry the
+    advertiser's name as artist, but they have no album.
+    """
+    media = get_spotify_media()
+    if media is None:
+        return None
+    title, artist, album = media
+    if title.strip().lower() not in AD_MEDIA_TITLES:
+        if artist.strip() and album.strip():
+            log.debug("Media info: '%s' by '%s' on '%s' — music", title, artist, album)
+            return False
+        return None  # ad with an advertiser as artist, podcast, local file, ...: let the screen scan decide
+    # Ad-like title: only trust it while Spotify is audibly playing, since it is
+    # also shown when paused.
+    peak = get_spotify_peak()
+    if peak is not None and peak > SILENCE_PEAK:
+        log.debug("Media info: '%s' with peak %.4f — ad", title, peak)
+        return True
+    return None
+
+
+# --- Spotify window ---
+
+# Screen rectangle (x, y, width, height) of Spotify's main window, or None to
+# scan the whole screen. Found once and only refreshed when the on-screen
+# volume icons stop matching (window moved, resized or minimised).
+SPOTIFY_REGION: tuple[int, int, int, int] | None = None
+
+
+def _is_spotify_window(hwnd: int) -> bool:
+    """Return True if hwnd is a visible, titled top-level window owned by Spotify.exe."""
+    if not win32gui.IsWindowVisible(hwnd) or not win32gui.GetWindowText(hwnd):
+        return False
+    if win32gui.GetClassName(hwnd) != 'Chrome_WidgetWin_0':
+        return False
+    try:
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        return psutil.Process(pid).name().lower() == 'spotify.exe'
+    except (psutil.Error, OSError):
+        return False
+
+
+def _spotify_windows() -> list[int]:
+    """Return the handles of Spotify's top-level windows."""
+    hwnds: list[int] = []
+
+    def collect(hwnd: int, _) -> bool:
+        if _is_spotify_window(hwnd):
+            hwnds.append(hwnd)
+        return True  # keep enumerating
+
+    win32gui.EnumWindows(collect, None)
+    return hwnds
+
+
+def find_spotify_window() -> int | None:
+    """Return the handle of Spotify's main window (even if minimised), or None."""
+    hwnds = _spotify_windows()
+    return hwnds[0] if hwnds else None
+
+
+def find_spotify_region() -> tuple[int, int, int, int] | None:
+    """Return Spotify's window rectangle clipped to the screen, or None if not visible."""
+    for hwnd in _spotify_windows():
+        if win32gui.IsIconic(hwnd):
+            continue
+        left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+        screen = _screen_grabber().monitors[0]  # bounding box of all monitors
+        left, top = max(left, screen['left']), max(top, screen['top'])
+        right = min(right, screen['left'] + screen['width'])
+        bottom = min(bottom, screen['top'] + screen['height'])
+        if right > left and bottom > top:
+            return left, top, right - left, bottom - top
+    return None
+
+
+def refresh_spotify_region():
+    """Look up Spotify's window again, falling back to full screen if not found."""
+    global SPOTIFY_REGION
+    SPOTIFY_REGION = find_spotify_region()
+    if SPOTIFY_REGION is None:
+        log.debug("Spotify window not found; scanning full screen")
+    else:
+        log.debug("Spotify window region: %s", SPOTIFY_REGION)
+
+
+def check_for_ad_title(title: str) -> bool | None:
+    """Decide from Spotify's window title whether an ad is playing.
+
+    Spotify titles its window 'Artist - Song' during music, and its own name
+    (or 'Advertisement') during ads and while paused. Returns True (ad-like
+    title while audio plays) or None otherwise. An 'Artist - Song' title is
+    never conclusive, since ads can be titled that way too; the screen scan
+    decides, and a title change still triggers it at once.
+    """
+    if title.strip().lower() in AD_MEDIA_TITLES:
+        peak = get_spotify_peak()
+        if peak is not None and peak > SILENCE_PEAK:
+            return True
+    return None
+
+
+class SpotifyWindowHook:
+    """Reports title changes and moves of Spotify's main window via SetWinEventHook.
+
+    The events arrive as window messages on the thread that called ensure(),
+    so that thread has to pump messages (PollTimer.sleep_until() does).
+    pywin32 doesn't wrap SetWinEventHook, hence ctypes.
+    """
+    EVENT_OBJECT_LOCATIONCHANGE = 0x800B
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    OBJID_WINDOW = 0
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WINEVENT_SKIPOWNPROCESS = 0x0002
+    _WINEVENTPROC = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                       wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+
+    def __init__(self, on_title_change: Callable[[str], None]):
+        self._user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self._user32.SetWinEventHook.restype = wintypes.HANDLE
+        self._user32.SetWinEventHook.argtypes = [
+            wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, self._WINEVENTPROC,
+            wintypes.DWORD, wintypes.DWORD, wintypes.DWORD,
+        ]
+        self._user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+        self._on_title_change = on_title_change
+        self._proc = self._WINEVENTPROC(self._callback)  # must outlive the hook
+        self._hook = None
+        self.hwnd: int | None = None
+        self.title = ''
+        self.moved = False  # set on every move/resize; cleared by the caller
+
+    def ensure(self) -> bool:
+        """Hook Spotify's current main window if not already hooked. Returns True while hooked."""
+        if self._hook and win32gui.IsWindow(self.hwnd):
+            return True
+        self.close()
+        hwnd = find_spotify_window()
+        if hwnd is None:
+            return False
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        self._hook = self._user32.SetWinEventHook(
+            self.EVENT_OBJECT_LOCATIONCHANGE, self.EVENT_OBJECT_NAMECHANGE, None, self._proc,
+            pid, 0, self.WINEVENT_OUTOFCONTEXT | self.WINEVENT_SKIPOWNPROCESS)
+        if not self._hook:
+            log.debug("SetWinEventHook failed (error %d)", ctypes.get_last_error())
+            return False
+        self.hwnd = hwnd
+        self.title = win32gui.GetWindowText(hwnd)
+        self.moved = True
+        log.debug("Watching Spotify window %#x ('%s')", hwnd, self.title)
+        return True
+
+    def _callback(self, hook, event, hwnd, id_object, id_child, event_thread, event_time):
+        if hwnd != self.hwnd or id_object != self.OBJID_WINDOW or id_child != 0:
+            return  # a child object (caret, text, ...) or another window
+        if event == self.EVENT_OBJECT_LOCATIONCHANGE:
+            self.moved = True
+            return
+        title = win32gui.GetWindowText(hwnd)
+        if title != self.title:
+            log.debug("Spotify window title: '%s' -> '%s'", self.title, title)
+            self.title = title
+            self._on_title_change(title)
+
+    def close(self):
+        """Remove the hook (from the thread that installed it)."""
+        if self._hook:
+            self._user32.UnhookWinEvent(self._hook)
+        self._hook = self.hwnd = None
+
+
+# --- Screen detection ---
+
+class Screenshot(NamedTuple):
+    """A grayscale capture of part of the screen, with its top-left screen offset."""
+    image: np.ndarray  # grayscale uint8
+    pyramid: tuple[np.ndarray, ...]  # pyramid[0] is image, then successive pyrDown levels
+    left: int
+    top: int
+    # Per-capture integral images and window statistics, filled in lazily by
+    # _window_stats() and shared by every template matched against this capture
+    cache: dict
+
+
+# One mss instance per thread: it keeps its device contexts between grabs, but
+# they can't be shared across threads.
+_grabbers = local()
+
+
+def _screen_grabber() -> 'mss.base.MSSBase':
+    """Return this thread's persistent mss screen grabber."""
+    if not hasattr(_grabbers, 'sct'):
+        _grabbers.sct = mss.mss()
+    return _grabbers.sct
+
+
+def grab_screen() -> Screenshot:
+    """Take a single screenshot of Spotify's window (or the whole screen).
+
+    Taken once per scan and shared by every locate_in() call, so the screen is
+    captured and converted to grayscale only once instead of once per template.
+    """
+    sct = _screen_grabber()
+    region = SPOTIFY_REGION
+    if region is not None:
+        left, top, width, height = region
+        monitor = {'left': left, 'top': top, 'width': width, 'height': height}
+    else:
+        monitor = sct.monitors[0]  # all monitors
+    raw = sct.grab(monitor)
+    bgra = np.frombuffer(raw.bgra, dtype=np.uint8).reshape(raw.height, raw.width, 4)
+    gray = cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY)
+    # Every matcher works on this one uint8 buffer as-is; nothing re-converts it
+    assert gray.dtype == np.uint8 and gray.flags['C_CONTIGUOUS']
+    return Screenshot(gray, build_pyramid(gray, PYRAMID_LEVELS), monitor['left'], monitor['top'], {})
+
+
+def _best_match(image: np.ndarray, template: np.ndarray) -> tuple[float, tuple[int, int]]:
+    """Return (score, top-left (x, y)) of the best TM_CCOEFF_NORMED match."""
+    result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return max_val, max_loc
+
+
+def _integrals(haystack: Screenshot, level: int) -> tuple[np.ndarray, np.ndarray]:
+    """Integral and squared integral (CV_64F) of one pyramid level, computed once per capture."""
+    key = ('integral', level)
+    if key not in haystack.cache:
+        haystack.cache[key] = cv2.integral2(haystack.pyramid[level], sdepth=cv2.CV_64F)
+    return haystack.cache[key]
+
+
+def _window_stats(haystack: Screenshot, level: int, h: int, w: int) -> tuple[np.ndarray, np.ndarray]:
+    """Per-position (sum, 1 / zero-mean L2 norm) of the screenshot's h x w windows.
+
+    Read off the level's integral images and cached per window size, so every
+    template (and coarse phase) of the same size shares them. Near-flat windows
+    get 0, so they score 0 instead of dividing by ~0 on Spotify's flat UI.
+    """
+    key = ('window', level, h, w)
+    if key not in haystack.cache:
+        sums, sq_sums = _integrals(haystack, level)
+        local_sum = sums[h:, w:] - sums[:-h, w:] - sums[h:, :-w] + sums[:-h, :-w]
+        local_sq = sq_sums[h:, w:] - sq_sums[:-h, w:] - sq_sums[h:, :-w] + sq_sums[:-h, :-w]
+        local_var = local_sq - local_sum * local_sum / (h * w)
+        with np.errstate(divide='ignore'):
+            inv_norm = np.where(local_var > 1.0, 1.0 / np.sqrt(local_var), 0.0)
+        haystack.cache[key] = local_sum.astype(np.float32), inv_norm.astype(np.float32)
+    return haystack.cache[key]
+
+
+def _normalized_match(haystack: Screenshot, level: int, template: np.ndarray,
+                      stats: tuple[float, float]) -> np.ndarray:
+    """TM_CCOEFF_NORMED scores of a template over a whole pyramid level.
+
+    Only the plain TM_CCORR correlation runs per template; the template's mean
+    and norm were computed at load and the screenshot's window statistics come
+    from _window_stats(), so OpenCV doesn't redo either on every call.
+    """
+    h, w = template.shape
+    mean, norm = stats
+    local_sum, inv_norm = _window_stats(haystack, level, h, w)
+    scores = cv2.matchTemplate(haystack.pyramid[level], template, cv2.TM_CCORR)
+    scores = cv2.scaleAdd(local_sum, -mean, scores)  # sum(I*T) - mean(T)*sum(I)
+    return cv2.multiply(scores, inv_norm, scale=1.0 / max(norm, 1e-6))
+
+
+def _window_match(window: np.ndarray, needle: Template) -> tuple[float, tuple[int, int]]:
+    """Best match of needle inside a small window, using its compiled kernel once it is ready."""
+    h, w = needle.image.shape
+    positions = (window.shape[0] - h + 1) * (window.shape[1] - w + 1)
+    if needle.kernel is not None and positions <= NCC_KERNEL_MAX_POSITIONS:
+        match = needle.kernel(window)
+        if match is not None:
+            return match
+    return _best_match(window, needle.image)
+
+
+def _prefiltered_match(haystack: Screenshot, needle: Template) -> tuple[float, tuple[int, int]] | None:
+    """Full-resolution match restricted to the positions that pass ad_prefilter.
+
+    Returns None when the prefilter can't help: numba is missing, or more than
+    PREFILTER_MAX_CANDIDATES positions passed.
+    """
+    if needle.samples is None:
+        return None
+    h, w = needle.image.shape
+    points, values = needle.samples
+    found = ad_prefilter.candidates(haystack.image, points, values, w, h,
+                                    PREFILTER_TOLERANCE * len(values), PREFILTER_MAX_CANDIDATES)
+    if found is None:
+        return None
+    best: tuple[float, tuple[int, int]] = (-1.0, (0, 0))
+    for x, y in found:
+        max_val, _ = _window_match(haystack.image[y:y + h, x:x + w], needle)
+        if max_val > best[0]:
+            best = (max_val, (x, y))
+            if max_val >= MATCH_CONFIDENCE:
+                break
+    return best
+
+
+def _refine_coarse_match(haystack: Screenshot, needle: Template) -> tuple[float, tuple[int, int]]:
+    """Match at the template's coarse level, then verify the strongest peaks at full resolution.
+
+    Returns the best full-resolution (score, top-left (x, y)) among the candidates
+    tried, stopping early at the first one that reaches MATCH_CONFIDENCE.
+    """
+    h, w = needle.image.shape
+    hay_h, hay_w = haystack.image.shape
+    results = [_normalized_match(haystack, needle.level, p.image, p.stats) for p in needle.phases]
+    peaks = [cv2.minMaxLoc(r)[1:4:2] for r in results]  # (max_val, max_loc) per phase
+    scale = 1 << needle.level
+    margin = 2  # rounding slack around the predicted full-resolution position
+    best: tuple[float, tuple[int, int]] = (-1.0, (0, 0))
+    for _ in range(COARSE_CANDIDATES):
+        i = max(range(len(peaks)), key=lambda j: peaks[j][0])
+        coarse_val, (cx, cy) = peaks[i]
+        if coarse_val < COARSE_CONFIDENCE:
+            break
+        phase = needle.phases[i]
+        px, py = cx * scale - phase.dx, cy * scale - phase.dy
+        x0, y0 = max(px - margin, 0), max(py - margin, 0)
+        x1, y1 = min(px + w + margin, hay_w), min(py + h + margin, hay_h)
+        if x1 - x0 >= w and y1 - y0 >= h:
+            max_val, (x, y) = _window_match(haystack.image[y0:y1, x0:x1], needle)
+            if max_val > best[0]:
+                best = (max_val, (x + x0, y + y0))
+            if max_val >= MATCH_CONFIDENCE:
+                break
+        # Suppress this peak so the next iteration looks elsewhere
+        results[i][max(cy - 1, 0):cy + 2, max(cx - 1, 0):cx + 2] = -1.0
+        peaks[i] = cv2.minMaxLoc(results[i])[1:4:2]
+    return best
+
+
+def locate_in(haystack: Screenshot, needle: Template | None):
+    """Locate a template inside a screenshot. Returns screen center (x, y) or None.
+
+    Tries the ad_prefilter fast path first, for every template: it gives up
+    after PREFILTER_MAX_CANDIDATES hits and otherwise runs 3-5x faster than the
+    coarse search, even on text-heavy screens. When it is unavailable or gives
+    up, searches the template's coarse (2x or 4x downsampled) pyramid level and
+    verifies the best coarse candidates in small full-resolution windows, or
+    matches the full screenshot when the template is too small to downsample.
+    """
+    if needle is None:
+        return None
+    h, w = needle.image.shape
+    hay_h, hay_w = haystack.image.shape
+    if h > hay_h or w > hay_w:
+        log.debug("locate_in skipped '%s': template larger than screenshot", needle.name)
+        return None
+    try:
+        match = _prefiltered_match(haystack, needle)
+        if match is None:
+            coarse_hay = haystack.pyramid[needle.level]
+            if needle.level == 0 or any(p.image.shape[0] > coarse_hay.shape[0] or p.image.shape[1] > coarse_hay.shape[1]
+                                        for p in needle.phases):
+                _, max_val, _, max_loc = cv2.minMaxLoc(_normalized_match(haystack, 0, needle.image, needle.stats))
+                match = max_val, max_loc
+            else:
+                match = _refine_coarse_match(haystack, needle)
+        max_val, (x, y) = match
+    except cv2.error as exc:
+        log.debug("locate_in failed for '%s': %s", needle.name, exc)
+        return None
+    if max_val < MATCH_CONFIDENCE:
+        return None
+    return haystack.left + x + w // 2, haystack.top + y + h // 2
+
+
+def is_muted_on_screen(haystack: Screenshot) -> bool | None:
     """Check Spotify's on-screen mute state using the volume folder images.
 
     Returns True if mute icon is visible, False if volume icon is visible,
     or None if neither could be found (Spotify not visible / minimised).
     """
-    if locate_image(image_mute) is not None:
+    if locate_in(haystack, image_mute) is not None:
         return True
-    if locate_image(image_volume) is not None:
+    if locate_in(haystack, image_volume) is not None:
         return False
     return None  # Spotify UI not visible
 
 
-def check_for_ad(ads: list[Path]):
-    """Return the screen position of the first matching ad image, or None."""
+# Per-template spectra for the batch FFT path, keyed by name, as complex64 (a
+# full-screen 4K spectrum is still ~33 MB each). Only spectra for the current
+# FFT shape are kept: a moved or resized window changes the shape, and
+# full-size spectra for every old shape would pile up.
+_template_spectra: dict[str, np.ndarray] = {}
+_spectra_shape: tuple[int, int] | None = None
+
+
+def _template_spectrum(template: Template, shape: tuple[int, int]) -> np.ndarray:
+    """Return the conjugated spectrum of the zero-mean template, cached for the current shape."""
+    global _spectra_shape
+    if shape != _spectra_shape:
+        _template_spectra.clear()
+        _spectra_shape = shape
+    if template.name not in _template_spectra:
+        zero_mean = template.image.astype(np.float32) - template.stats[0]
+        _template_spectra[template.name] = np.conj(np.fft.rfft2(zero_mean, shape)).astype(np.complex64)
+    return _template_spectra[template.name]
+
+
+def _fft_ncc_matches(ads: list[Template], haystack: Screenshot) -> list[tuple[float, tuple[int, int]]]:
+    """Score every template against one FFT of the screenshot (J. P. Lewis, "Fast Normalized Cross-Correlation").
+
+    The correlation of the screenshot with each zero-mean template comes from
+    the shared spectrum; the screenshot's window norms come from
+    _window_stats(), shared with the per-template matchers. Returns (score, top-left (x, y)) per
+    template, with score -1 where the template doesn't fit.
+    """
+    image = haystack.image
+    hay_h, hay_w = image.shape
+    shape = (cv2.getOptimalDFTSize(hay_h), cv2.getOptimalDFTSize(hay_w))
+    spectrum = np.fft.rfft2(image.astype(np.float32), shape)
+    matches = []
     for ad in ads:
+        h, w = ad.image.shape
+        if h > hay_h or w > hay_w:
+            matches.append((-1.0, (0, 0)))
+            continue
+        corr = np.fft.irfft2(spectrum * _template_spectrum(ad, shape), shape)[:hay_h - h + 1, :hay_w - w + 1]
+        _, inv_norm = _window_stats(haystack, 0, h, w)
+        scores = corr * inv_norm / max(ad.stats[1], 1e-6)
+        y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+        matches.append((float(scores[y, x]), (int(x), int(y))))
+    return matches
+
+
+# CUDA matchers keyed by the names of the templates they were uploaded with.
+_gpu_matchers: dict[tuple[str, ...], 'cuda_match.CudaMatcher'] = {}
+_gpu_ok = USE_GPU and cuda_match is not None  # cleared if the GPU path ever fails
+
+
+def _use_gpu(ads: list[Template], haystack: Screenshot) -> bool:
+    """Return True when matching on the GPU is available and worth the upload."""
+    return _gpu_ok and len(ads) * haystack.image.size >= GPU_MIN_WORK
+
+
+def _gpu_matcher(ads: list[Template]) -> 'cuda_match.CudaMatcher':
+    """Return the CUDA matcher for these templates, uploading them on first use."""
+    key = tuple(ad.name for ad in ads)
+    if key not in _gpu_matchers:
+        _gpu_matchers[key] = cuda_match.CudaMatcher([ad.image for ad in ads])
+    return _gpu_matchers[key]
+
+
+def _disable_gpu(exc: Exception):
+    global _gpu_ok
+    log.warning("CUDA matching failed, using the CPU from now on: %s", exc)
+    _gpu_ok = False
+    _gpu_matchers.clear()
+
+
+# Upload the ad images once at startup rather than on the first scan
+if _gpu_ok and image_ads_dedup:
+    try:
+        _gpu_matcher(image_ads_dedup)
+    except cv2.error as exc:
+        _disable_gpu(exc)
+
+
+# Worker pool for matching ad templates concurrently; cv2.matchTemplate releases
+# the GIL, so templates really are matched in parallel on a shared screenshot.
+_match_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='match')
+
+
+def _locate_unless_found(haystack: Screenshot, ad: Template, found: Event):
+    """locate_in() for the pool; skips the work if another template already matched."""
+    if found.is_set():
+        return None
+    if log.isEnabledFor(logging.DEBUG):
         log.debug("Checking ad image: '%s'", ad.name)
-        pos = locate_image(ad)
+    pos = locate_in(haystack, ad)
+    if pos is not None:
+        found.set()
+    return pos
+
+
+def _first_confident(ads: list[Template], matches: list[tuple[float, tuple[int, int]]],
+                     haystack: Screenshot, method: str):
+    """Return the screen center of the first batch match reaching MATCH_CONFIDENCE, or None."""
+    for ad, (score, (x, y)) in zip(ads, matches):
+        if score >= MATCH_CONFIDENCE:
+            h, w = ad.image.shape
+            pos = haystack.left + x + w // 2, haystack.top + y + h // 2
+            log.info("Ad detected via image '%s' at %s (%s)", ad.name, pos, method)
+            return pos
+    return None
+
+
+def check_for_ad(ads: list[Template], haystack: Screenshot):
+    """Return the screen position of a matching ad image, or None.
+
+    Large scans go to the GPU when one is available, and all templates share one
+    FFT when USE_FFT_MATCHING is set. Otherwise templates are matched
+    concurrently, returning as soon as any one of them matches.
+    """
+    if _use_gpu(ads, haystack):
+        try:
+            return _first_confident(ads, _gpu_matcher(ads).match(haystack.image), haystack, 'GPU')
+        except cv2.error as exc:
+            _disable_gpu(exc)
+    if USE_FFT_MATCHING:
+        return _first_confident(ads, _fft_ncc_matches(ads, haystack), haystack, 'FFT')
+    found = Event()
+    futures = {_match_pool.submit(_locate_unless_found, haystack, ad, found): ad for ad in ads}
+    for future in as_completed(futures):
+        pos = future.result()
         if pos is not None:
-            log.info("Ad detected via image '%s' at %s", ad.name, pos)
+            for other in futures:
+                other.cancel()  # only stops ones not started yet; the rest see `found`
+            log.info("Ad detected via image '%s' at %s", futures[future].name, pos)
             return pos
     return None
 
@@ -156,11 +994,31 @@ def diagnose():
     sessions = AudioUtilities.GetAllSessions()
     names = [s.Process.name() for s in sessions if s.Process]
     log.info("Active audio sessions: %s", names)
-    spotify_found = any(n.lower() == 'spotify.exe' for n in names)
+    spotify_found = _get_spotify_volume() is not None
     log.info("Spotify audio session found: %s", spotify_found)
+    if spotify_found:
+        log.info("Spotify peak level: %s, session muted: %s", get_spotify_peak(), get_spotify_mute())
+
+    # 1b. Check what Spotify reports to Windows as the current track
+    if MediaSessionManager is None:
+        log.info("Media metadata: unavailable (pip install winrt-Windows.Media.Control)")
+    else:
+        log.info("Media metadata (title, artist, album): %s", get_spotify_media())
+        log.info("Ad detected from metadata: %s", check_for_ad_metadata())
 
     # 2. Check on-screen mute state via volume images
-    screen_muted = is_muted_on_screen()
+    refresh_spotify_region()
+    log.info("Spotify window region: %s", SPOTIFY_REGION or "not found (scanning full screen)")
+    hwnd = find_spotify_window()
+    if hwnd is not None:
+        title = win32gui.GetWindowText(hwnd)
+        log.info("Spotify window title: '%s' (ad from title: %s)", title, check_for_ad_title(title))
+    try:
+        haystack = grab_screen()
+    except Exception as exc:
+        log.warning("Screen capture failed: %s", exc)
+        haystack = None
+    screen_muted = is_muted_on_screen(haystack) if haystack is not None else None
     if screen_muted is True:
         log.info("On-screen mute state: MUTED (mute icon visible)")
     elif screen_muted is False:
@@ -168,80 +1026,284 @@ def diagnose():
     else:
         log.warning("On-screen mute state: UNKNOWN (neither icon found — is Spotify visible?)")
 
-    # 2. Check ad images exist on disk
-    log.info("Ad images loaded: %d", len(image_ads))
+    # 2. Check ad images were decoded from disk
+    log.info("Ad images loaded: %d (%d matched after removing duplicates)", len(image_ads), len(image_ads_dedup))
     for p in image_ads:
-        log.info("  %s  exists=%s", p.name, p.exists())
+        log.info("  %s  size=%dx%d", p.name, p.image.shape[1], p.image.shape[0])
+    log.info("GPU matching: %s", "CUDA" if _gpu_ok else "unavailable (needs OpenCV built with CUDA)")
 
     # 3. Try screen detection for each ad image
-    log.info("Running screen scan for each ad image...")
-    any_found = False
-    for p in image_ads:
-        pos = locate_image(p)
-        if pos is not None:
-            log.info("  FOUND '%s' at %s", p.name, pos)
-            any_found = True
-        else:
-            log.info("  NOT found: '%s'", p.name)
-    if not any_found:
-        log.info("No ad images matched on screen. Is Spotify showing an ad right now?")
+    if haystack is None:
+        log.warning("Skipping screen scan: no screenshot")
+    else:
+        log.info("Running screen scan for each ad image...")
+        any_found = False
+        for p in image_ads:
+            pos = locate_in(haystack, p)
+            if pos is not None:
+                log.info("  FOUND '%s' at %s", p.name, pos)
+                any_found = True
+            else:
+                log.info("  NOT found: '%s'", p.name)
+        if not any_found:
+            log.info("No ad images matched on screen. Is Spotify showing an ad right now?")
 
     log.info("--- DIAGNOSE END ---")
 
 
+# --- Timing ---
+
+class PollTimer:
+    """Sleeps until an absolute time.monotonic() deadline, or until wake() is called.
+
+    Uses a high-resolution Windows waitable timer when available, so ticks
+    don't inherit the ~15.6 ms granularity of the default system timer; falls
+    back to a plain timed wait otherwise. While waiting on the timer it also
+    dispatches the calling thread's window messages, which is how
+    SpotifyWindowHook events get delivered.
+    """
+    CREATE_WAITABLE_TIMER_HIGH_RESOLUTION = 0x00000002
+    TIMER_ALL_ACCESS = 0x001F0003
+    INFINITE = 0xFFFFFFFF
+    QS_ALLINPUT = 0x04FF
+    PM_REMOVE = 0x0001
+    WAIT_MESSAGE = 2  # MsgWaitForMultipleObjects result: WAIT_OBJECT_0 + number of handles
+
+    def __init__(self):
+        self._kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self._kernel32.CreateWaitableTimerExW.restype = wintypes.HANDLE
+        self._kernel32.SetWaitableTimer.argtypes = [
+            wintypes.HANDLE, ctypes.POINTER(wintypes.LARGE_INTEGER), wintypes.LONG,
+            ctypes.c_void_p, ctypes.c_void_p, wintypes.BOOL,
+        ]
+        self._user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self._user32.MsgWaitForMultipleObjects.argtypes = [
+            wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE), wintypes.BOOL, wintypes.DWORD, wintypes.DWORD,
+        ]
+        self._user32.PeekMessageW.argtypes = [
+            ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT, wintypes.UINT,
+        ]
+        self._user32.TranslateMessage.argtypes = [ctypes.POINTER(wintypes.MSG)]
+        self._user32.DispatchMessageW.argtypes = [ctypes.POINTER(wintypes.MSG)]
+        self._kernel32.CreateEventW.restype = wintypes.HANDLE
+        self._kernel32.SetEvent.argtypes = [wintypes.HANDLE]
+        self._kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self._fallback_wake = Event()
+        # wake() can run on any thread; never let it signal a handle close() has released
+        self._wake_lock = Lock()
+        self._wake_handle = self._kernel32.CreateEventW(None, False, False, None)  # auto-reset
+        self._handle = self._kernel32.CreateWaitableTimerExW(
+            None, None, self.CREATE_WAITABLE_TIMER_HIGH_RESOLUTION, self.TIMER_ALL_ACCESS)
+        if not self._handle:
+            # High-resolution timers need Windows 10 1803+; use a regular one instead
+            log.debug("High-resolution waitable timer unavailable (error %d)", ctypes.get_last_error())
+            self._handle = self._kernel32.CreateWaitableTimerExW(None, None, 0, self.TIMER_ALL_ACCESS)
+
+    def sleep_until(self, deadline: float):
+        """Block until time.monotonic() reaches deadline (returns at once if already past)."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if self._handle and self._wake_handle:
+            due = wintypes.LARGE_INTEGER(-int(remaining * 10_000_000))  # relative, 100 ns units
+            if self._kernel32.SetWaitableTimer(self._handle, ctypes.byref(due), 0, None, None, False):
+                handles = (wintypes.HANDLE * 2)(self._handle, self._wake_handle)
+                while self._user32.MsgWaitForMultipleObjects(
+                        2, handles, False, self.INFINITE, self.QS_ALLINPUT) == self.WAIT_MESSAGE:
+                    self._pump_messages()
+                return
+        self._fallback_wake.wait(max(0.0, deadline - time.monotonic()))
+        self._fallback_wake.clear()
+
+    @property
+    def pumps_messages(self) -> bool:
+        """True if sleep_until() dispatches window messages (i.e. the waitable timer works)."""
+        return bool(self._handle and self._wake_handle)
+
+    def _pump_messages(self):
+        msg = wintypes.MSG()
+        while self._user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, self.PM_REMOVE):
+            self._user32.TranslateMessage(ctypes.byref(msg))
+            self._user32.DispatchMessageW(ctypes.byref(msg))
+
+    def wake(self):
+        """Cut the current (or next) sleep_until() short."""
+        with self._wake_lock:
+            if self._wake_handle:
+                self._kernel32.SetEvent(self._wake_handle)
+        self._fallback_wake.set()
+
+    def close(self):
+        """Release the underlying timer and event handles."""
+        with self._wake_lock:
+            handles = (self._handle, self._wake_handle)
+            self._handle = self._wake_handle = None
+            for handle in handles:
+                if handle:
+                    self._kernel32.CloseHandle(handle)
+
+
 # --- Worker thread ---
 
 class MuteAd(Thread):
     # How long to sleep between checks depending on ad state
     SLEEP_AD_ACTIVE  = 0.5   # seconds — poll quickly while ad is playing
     SLEEP_AD_IDLE    = 5.0   # seconds — poll slowly during normal playback
+    # While nothing changes, the idle sleep grows by SLEEP_IDLE_BACKOFF per check
+    # up to SLEEP_IDLE_MAX; any state change resets it to SLEEP_AD_IDLE.
+    SLEEP_IDLE_BACKOFF = 1.5
+    SLEEP_IDLE_MAX     = 15.0  # seconds
+    # While Spotify's window title is being watched, a title change triggers a
+    # check at once, so idle polling only needs to be a slow safety net.
+    SLEEP_EVENT_SAFETY = 60.0  # seconds
 
     def __init__(self):
         super().__init__(daemon=True)
         self.program_running = True
         self.running = False
         self._muted = False
+        self._ad_playing = False
+        self._idle_sleep = self.SLEEP_AD_IDLE
+        self._timer = PollTimer()
+        self._window = SpotifyWindowHook(lambda title: self._timer.wake())
+        self._event_driven = False
 
     def run(self):
-        while self.program_running:
-            if not self.running:
-                time.sleep(0.2)
-                continue
+        try:
+            while self.program_running:
+                if not self.running:
+                    time.sleep(0.2)
+                    continue
+                # Sleep relative to when the scan started, so scan time doesn't stretch the period
+                tick_start = time.monotonic()
+                # Hooked from this thread, so the events arrive while it sleeps on the timer
+                self._event_driven = self._timer.pumps_messages and self._window.ensure()
+                try:
+                    period = self._scan()
+                except Exception as exc:
+                    # e.g. the screen can't be captured on the lock screen / UAC desktop,
+                    # or Spotify exited mid-scan; keep the worker alive and retry later
+                    log.warning("Scan failed: %s", exc)
+                    period = self.SLEEP_AD_IDLE
+                self._timer.sleep_until(tick_start + period)
+        finally:
+            self._window.close()
+            self._timer.close()
 
+    def _next_idle_sleep(self, changed: bool) -> float:
+        """Return the idle sleep, backing off while nothing changes."""
+        longest = self.SLEEP_EVENT_SAFETY if self._event_driven else self.SLEEP_IDLE_MAX
+        if changed:
+            self._idle_sleep = self.SLEEP_AD_IDLE
+        else:
+            self._idle_sleep = min(self._idle_sleep * self.SLEEP_IDLE_BACKOFF, longest)
+        return self._idle_sleep
+
+    def _scan(self) -> float:
+        """Run one detection pass and return how long to wait before the next one."""
+        if USE_PYCAW and not self._muted:
+            # Nothing to detect while Spotify is silent (paused) — skip the scan
+            peak = get_spotify_peak()
+            if peak is not None and peak <= SILENCE_PEAK:
+                log.debug("Spotify is silent (peak %.5f); skipping scan", peak)
+                return self._next_idle_sleep(changed=False)
+
+        if self._window.moved:
+            self._window.moved = False
+            refresh_spotify_region()
+        ad_playing = check_for_ad_metadata() if USE_MEDIA_METADATA else None
+        if ad_playing is None and self._event_driven:
+            ad_playing = check_for_ad_title(self._window.title)
+        haystack = None
+        if ad_playing is None:
             log.debug("Scanning screen for ads... (muted=%s)", self._muted)
-            ad_pos = check_for_ad(image_ads)
-
-            # Sync internal state with what Spotify actually shows on screen
-            screen_muted = is_muted_on_screen()
-            if screen_muted is not None and screen_muted != self._muted:
-                log.debug("Mute state corrected from screen: %s -> %s", self._muted, screen_muted)
-                self._muted = screen_muted
-
-            if ad_pos is not None:
-                # Ad is playing — mute if not already muted
-                if not self._muted:
-                    log.info("Ad detected — muting Spotify")
-                    if set_spotify_mute(True):
-                        self._muted = True
-                time.sleep(self.SLEEP_AD_ACTIVE)
-            else:
-                log.debug("No ad on screen.")
-                # No ad — unmute if we were the ones who muted
-                if self._muted:
-                    log.info("Ad gone — unmuting Spotify")
-                    if set_spotify_mute(False):
-                        self._muted = False
-                time.sleep(self.SLEEP_AD_IDLE)
+            haystack = grab_screen()
+            ad_playing = check_for_ad(image_ads_dedup, haystack) is not None
+
+        # Sync internal state with Spotify's actual mute state. pycaw mutes the
+        # audio session without changing Spotify's own volume icon, so read it back
+        # from the session; otherwise read the icon from the screen.
+        actual_muted = get_spotify_mute() if USE_PYCAW else None
+        if haystack is not None or not USE_PYCAW:
+            if haystack is None:
+                haystack = grab_screen()
+            screen_muted = is_muted_on_screen(haystack)
+            if screen_muted is None or SPOTIFY_REGION is None:
+                # Volume icons not found (or no window yet) — Spotify's window may have moved
+                refresh_spotify_region()
+            if not USE_PYCAW:
+                actual_muted = screen_muted
+        changed = ad_playing != self._ad_playing
+        self._ad_playing = ad_playing
+        if actual_muted is not None and actual_muted != self._muted:
+            log.debug("Mute state corrected: %s -> %s", self._muted, actual_muted)
+            self._muted = actual_muted
+            changed = True
+
+        if ad_playing:
+            # Ad is playing — mute if not already muted
+            if not self._muted:
+                log.info("Ad detected — muting Spotify")
+                if set_spotify_mute(True):
+                    self._muted = True
+            return self.SLEEP_AD_ACTIVE
+        else:
+            log.debug("No ad on screen.")
+            # No ad — unmute if we were the ones who muted
+            if self._muted:
+                log.info("Ad gone — unmuting Spotify")
+                if set_spotify_mute(False):
+                    self._muted = False
+            return self._next_idle_sleep(changed)
 
     def stop(self):
         """Signal the thread to exit cleanly, and unmute if needed."""
         self.running = False
         self.program_running = False
+        self._timer.wake()
         if self._muted:
             set_spotify_mute(False)
             self._muted = False
 
 
+# --- Console ---
+
+STD_OUTPUT_HANDLE = -11
+
+
+class COORD(ctypes.Structure):
+    """Win32 COORD: a character cell position or console size."""
+    _fields_ = [('X', wintypes.SHORT), ('Y', wintypes.SHORT)]
+
+
+def set_console_size(cols: int, lines: int) -> bool:
+    """Resize the console window and buffer in-process (same effect as `mode con`).
+
+    Returns True on success. Terminals that manage their own size, such as
+    Windows Terminal, ignore this just like they ignore `mode con`.
+    """
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.GetStdHandle.restype = wintypes.HANDLE
+    kernel32.SetConsoleScreenBufferSize.argtypes = [wintypes.HANDLE, COORD]
+    kernel32.SetConsoleWindowInfo.argtypes = [wintypes.HANDLE, wintypes.BOOL, ctypes.POINTER(wintypes.SMALL_RECT)]
+    handle = kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+    size = COORD(cols, lines)
+    window = wintypes.SMALL_RECT(0, 0, cols - 1, lines - 1)
+
+    def set_buffer() -> bool:
+        return bool(kernel32.SetConsoleScreenBufferSize(handle, size))
+
+    def set_window() -> bool:
+        return bool(kernel32.SetConsoleWindowInfo(handle, True, ctypes.byref(window)))
+
+    # The window must always fit inside the buffer: when growing, resize the
+    # buffer first; when shrinking, the window.
+    ok = (set_buffer() and set_window()) or (set_window() and set_buffer())
+    if not ok:
+        log.debug("Could not resize console to %dx%d (error %d)", cols, lines, ctypes.get_last_error())
+    return bool(ok)
+
+
 # --- Menu ---
 
 def show_menu(mute_ad: MuteAd) -> bool:
@@ -258,10 +1320,10 @@ def show_menu(mute_ad: MuteAd) -> bool:
         log.info("Muter stopped")
         return True
     elif index == 2:
-        os.system('mode con cols=120 lines=40')
+        set_console_size(120, 40)
         diagnose()
         input("\nPress Enter to return to menu...")
-        os.system('mode con cols=30 lines=7')
+        set_console_size(30, 7)
     return False
 
 
@@ -273,7 +1335,7 @@ def main():
 
     try:
         if USE_MENU:
-            os.system('mode con cols=30 lines=7')
+            set_console_size(30, 7)
             while True:
                 if show_menu(mute_ad):
                     break
@@ -0,0 +1,96 @@
+"""
+Shared fixtures for the matching tests. spotify-ad-mute.py imports Windows-only
+modules at the top; they are stubbed here so its image matching code can be
+loaded and tested on any platform.
+"""
+
+import sys
+import types
+import ctypes
+import importlib.util
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+class _COMError(Exception):
+    pass
+
+
+class _AudioSessionEvents:
+    pass
+
+
+def _stub(name: str, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules.setdefault(name, module)
+
+
+def _load_app():
+    if not hasattr(ctypes, 'WINFUNCTYPE'):
+        ctypes.WINFUNCTYPE = ctypes.CFUNCTYPE
+    _stub('win32gui')
+    _stub('win32process')
+    _stub('pyautogui', click=None)
+    _stub('pick', pick=None)
+    _stub('pycaw')
+    _stub('pycaw.pycaw', AudioUtilities=None, ISimpleAudioVolume=type('ISimpleAudioVolume', (), {}),
+          IAudioMeterInformation=None)
+    _stub('pycaw.callbacks', AudioSessionEvents=_AudioSessionEvents)
+    _stub('comtypes', COMError=_COMError)
+    spec = importlib.util.spec_from_file_location('spotify_ad_mute', ROOT / 'spotify-ad-mute.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The spotify-ad-mute module, loaded with its Windows dependencies stubbed."""
+    return _load_app()
+
+
+@pytest.fixture
+def screenshot(app):
+    """Wrap a grayscale uint8 image as a Screenshot at the screen origin."""
+    def make(image: np.ndarray):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        return app.Screenshot(image, app.build_pyramid(image, app.PYRAMID_LEVELS), 0, 0, {})
+    return make
+
+
+@pytest.fixture
+def spotify_screen():
+    """Make a dark, mostly flat screen with text-like bars and a noisy cover-art block."""
+    def make(rng: np.random.Generator, height: int = 360, width: int = 640) -> np.ndarray:
+        image = np.full((height, width), 24, dtype=np.uint8)
+        image[20:100, 20:100] = rng.integers(0, 256, (80, 80), dtype=np.uint8)
+        for _ in range(30):
+            y, x = rng.integers(0, height - 10), rng.integers(0, width - 80)
+            image[y:y + rng.integers(3, 9), x:x + rng.integers(10, 80)] = rng.choice([120, 179, 200])
+        return image
+    return make
+
+
+_UI_WORDS = ('home search your library liked songs playlist artist album podcast episode '
+             'shuffle play next queue lyrics radio mix daily discover weekly release radar').split()
+
+
+@pytest.fixture
+def text_screen():
+    """Make a dark screen packed with lines of UI-like text, as on a busy Spotify page."""
+    def make(rng: np.random.Generator, height: int = 500, width: int = 800, lines: int = 120) -> np.ndarray:
+        image = np.full((height, width), 18, dtype=np.uint8)
+        for _ in range(lines):
+            x, y = int(rng.integers(0, width - 200)), int(rng.integers(12, height - 4))
+            text = ' '.join(rng.choice(_UI_WORDS, int(rng.integers(2, 7))))
+            cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, float(rng.choice([0.35, 0.4, 0.5, 0.6])),
+                        int(rng.choice([120, 150, 179, 255])), 1, cv2.LINE_AA)
+        return image
+    return make
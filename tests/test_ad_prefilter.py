@@ -0,0 +1,85 @@
+"""numba SAD prefilter (ad_prefilter) and the locate_in() fast path built on it."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+import ad_prefilter  # noqa: E402
+
+
+def _candidates(app, image, template, max_count=10**9):
+    points, values = ad_prefilter.select_samples(template, app.PREFILTER_SAMPLES)
+    h, w = template.shape
+    return ad_prefilter.candidates(image, points, values, w, h, app.PREFILTER_TOLERANCE * len(values), max_count)
+
+
+def test_select_samples_covers_strokes_and_gaps(app):
+    template = app.image_volume.image
+    points, values = ad_prefilter.select_samples(template, 8)
+    assert points.shape == (8, 2) and values.shape == (8,)
+    assert np.all((points[:, 0] < template.shape[1]) & (points[:, 1] < template.shape[0]))
+    background = int(np.median(template))
+    assert np.count_nonzero(np.abs(values - background) > 64) == 4  # strokes
+    assert len({tuple(p) for p in points.tolist()}) == 8
+
+
+def test_flat_screen_has_no_candidates(app):
+    image = np.full((200, 300), 24, dtype=np.uint8)
+    for template in [app.image_volume, app.image_mute, *app.image_ads]:
+        assert _candidates(app, image, template.image) == []
+
+
+@pytest.mark.parametrize('contrast', [1.0, 0.5, 1.4])
+@pytest.mark.parametrize('shift', [0, 25, -20])
+def test_true_position_passes_brightness_and_contrast_changes(app, contrast, shift):
+    rng = np.random.default_rng(0)
+    for template in [app.image_volume, *app.image_ads]:
+        h, w = template.image.shape
+        image = np.full((120, 200), 24, dtype=np.uint8)
+        y, x = int(rng.integers(0, 120 - h)), int(rng.integers(0, 200 - w))
+        pixels = template.image.astype(float)
+        image[y:y + h, x:x + w] = np.clip((pixels - pixels.mean()) * contrast + pixels.mean() + shift, 0, 255)
+        assert (x, y) in _candidates(app, image, template.image), template.name
+
+
+def test_candidates_stop_past_max_count(app):
+    rng = np.random.default_rng(1)
+    template = rng.integers(0, 256, (6, 6), dtype=np.uint8)
+    image = np.tile(template, (20, 20))  # the template repeats every 6 pixels
+    assert len(_candidates(app, image, template)) >= 100
+    assert _candidates(app, image, template, max_count=10) is None
+
+
+def test_locate_in_prefilter_path_finds_random_placements(app, screenshot, spotify_screen):
+    rng = np.random.default_rng(2)
+    for template in [app.image_volume, app.image_mute, *app.image_ads]:
+        assert template.samples is not None
+        h, w = template.image.shape
+        for _ in range(10):
+            image = spotify_screen(rng)
+            y, x = int(rng.integers(0, image.shape[0] - h + 1)), int(rng.integers(0, image.shape[1] - w + 1))
+            image[y:y + h, x:x + w] = template.image
+            haystack = screenshot(image)
+            assert app._prefiltered_match(haystack, template) is not None, template.name
+            assert app.locate_in(haystack, template) == (x + w // 2, y + h // 2), template.name
+
+
+def test_locate_in_finds_low_contrast_placements(app, screenshot, text_screen):
+    """A miss is conclusive, so the prefilter must not reject what normalised correlation accepts."""
+    rng = np.random.default_rng(4)
+    for template in [app.image_volume, app.image_mute, *app.image_ads]:
+        h, w = template.image.shape
+        image = text_screen(rng)
+        y, x = int(rng.integers(0, image.shape[0] - h + 1)), int(rng.integers(0, image.shape[1] - w + 1))
+        pixels = template.image.astype(float)
+        image[y:y + h, x:x + w] = (pixels - pixels.mean()) * 0.5 + pixels.mean()
+        assert app.locate_in(screenshot(image), template) == (x + w // 2, y + h // 2), template.name
+
+
+@pytest.mark.parametrize('screen', ['spotify_screen', 'text_screen'])
+def test_prefilter_miss_is_conclusive(app, screenshot, request, screen):
+    haystack = screenshot(request.getfixturevalue(screen)(np.random.default_rng(3)))
+    for template in [app.image_volume, app.image_mute, *app.image_ads]:
+        match = app._prefiltered_match(haystack, template)
+        assert match is not None, template.name  # selective enough to skip the pyramid search
+        assert match[0] < app.MATCH_CONFIDENCE
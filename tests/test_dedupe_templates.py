@@ -0,0 +1,48 @@
+"""Merging identical and near-identical ad images (dedupe_templates)."""
+
+import types
+
+import numpy as np
+
+
+def _template(app, name: str, image: np.ndarray):
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    return app.Template(name, image, 0, (), None, app.template_stats(image))
+
+
+class _FakeHash:
+    """Stands in for an imagehash pHash: the distance is the difference of one pixel value."""
+
+    def __init__(self, value: int):
+        self.value = value
+
+    def __sub__(self, other: '_FakeHash') -> int:
+        return abs(self.value - other.value)
+
+
+def test_identical_images_merge_and_other_sizes_stay(app, monkeypatch):
+    monkeypatch.setattr(app, 'imagehash', None)
+    image = np.random.default_rng(0).integers(0, 256, (10, 20), dtype=np.uint8)
+    templates = [
+        _template(app, 'a.png', image),
+        _template(app, 'a_copy.png', image.copy()),
+        _template(app, 'a_cropped.png', image[:, :19]),
+        _template(app, 'b.png', 255 - image),
+    ]
+    assert [t.name for t in app.dedupe_templates(templates)] == ['a.png', 'a_cropped.png', 'b.png']
+
+
+def test_near_duplicates_keep_their_medoid(app, monkeypatch):
+    monkeypatch.setattr(app, 'imagehash', types.SimpleNamespace(phash=lambda img: _FakeHash(int(img.value))))
+    # PIL's Image is only imported alongside imagehash, hence raising=False
+    monkeypatch.setattr(app, 'Image', types.SimpleNamespace(fromarray=lambda a: types.SimpleNamespace(value=a[0, 0])),
+                        raising=False)
+
+    def solid(name, value, shape=(8, 8)):
+        return _template(app, name, np.full(shape, value))
+
+    templates = [solid('a.png', 10), solid('b.png', 12), solid('c.png', 13),  # distances 2, 3 and 1
+                 solid('far.png', 30), solid('wide.png', 11, (8, 9))]
+    # b.png is closest to the rest of its group (2 + 1); far.png is too far
+    # away and wide.png has another size, so both stay on their own
+    assert [t.name for t in app.dedupe_templates(templates)] == ['b.png', 'far.png', 'wide.png']
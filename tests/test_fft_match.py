@@ -0,0 +1,51 @@
+"""Batch FFT normalised cross-correlation (_fft_ncc_matches) vs OpenCV."""
+
+import cv2
+import numpy as np
+
+
+def _template(app, image: np.ndarray, name: str):
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    return app.Template(name, image, 0, (), None, app.template_stats(image))
+
+
+def test_fft_scores_agree_with_ccoeff_normed(app, screenshot):
+    rng = np.random.default_rng(0)
+    haystack = screenshot(rng.integers(0, 256, (180, 250), dtype=np.uint8))
+    ads = [_template(app, rng.integers(0, 256, (h, w), dtype=np.uint8), f'ad{i}.png')
+           for i, (h, w) in enumerate([(17, 76), (22, 68), (40, 40)])]
+    for ad, (score, loc) in zip(ads, app._fft_ncc_matches(ads, haystack)):
+        _, expected, _, expected_loc = cv2.minMaxLoc(
+            cv2.matchTemplate(haystack.image, ad.image, cv2.TM_CCOEFF_NORMED))
+        assert abs(score - expected) < 1e-3
+        assert loc == expected_loc
+
+
+def test_fft_finds_pasted_templates(app, screenshot, spotify_screen):
+    rng = np.random.default_rng(1)
+    ads = list(app.image_ads_dedup)
+    for _ in range(5):
+        image = spotify_screen(rng)
+        ad = ads[int(rng.integers(len(ads)))]
+        h, w = ad.image.shape
+        y, x = int(rng.integers(0, image.shape[0] - h + 1)), int(rng.integers(0, image.shape[1] - w + 1))
+        image[y:y + h, x:x + w] = ad.image
+        matches = app._fft_ncc_matches(ads, screenshot(image))
+        score, loc = matches[ads.index(ad)]
+        assert score >= app.MATCH_CONFIDENCE
+        assert loc == (x, y)
+
+
+def test_fft_skips_templates_larger_than_screenshot(app, screenshot):
+    haystack = screenshot(np.random.default_rng(2).integers(0, 256, (20, 30), dtype=np.uint8))
+    ad = _template(app, np.random.default_rng(3).integers(0, 256, (25, 10), dtype=np.uint8), 'tall.png')
+    assert app._fft_ncc_matches([ad], haystack) == [(-1.0, (0, 0))]
+
+
+def test_template_spectra_only_kept_for_current_shape(app):
+    ad = app.image_ads[0]
+    app._template_spectrum(ad, (64, 128))
+    app._template_spectrum(ad, (72, 128))
+    assert list(app._template_spectra) == [ad.name]
+    assert app._template_spectra[ad.name].shape == (72, 65)
+    assert app._template_spectra[ad.name].dtype == np.complex64
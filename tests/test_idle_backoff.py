@@ -0,0 +1,29 @@
+"""Idle polling backoff (MuteAd._next_idle_sleep)."""
+
+import pytest
+
+
+def _worker(app, event_driven: bool):
+    # Skip MuteAd.__init__: its PollTimer and window hook need Windows
+    worker = app.MuteAd.__new__(app.MuteAd)
+    worker._idle_sleep = app.MuteAd.SLEEP_AD_IDLE
+    worker._event_driven = event_driven
+    return worker
+
+
+@pytest.mark.parametrize('event_driven', [False, True])
+def test_idle_sleep_backs_off_to_its_cap(app, event_driven):
+    worker = _worker(app, event_driven)
+    cap = app.MuteAd.SLEEP_EVENT_SAFETY if event_driven else app.MuteAd.SLEEP_IDLE_MAX
+    sleeps = [worker._next_idle_sleep(changed=False) for _ in range(20)]
+    assert sleeps[:3] == [7.5, 11.25, pytest.approx(16.875) if event_driven else 15.0]
+    assert sleeps == sorted(sleeps)
+    assert sleeps[-1] == cap
+
+
+def test_idle_sleep_resets_on_change(app):
+    worker = _worker(app, event_driven=True)
+    for _ in range(10):
+        worker._next_idle_sleep(changed=False)
+    assert worker._next_idle_sleep(changed=True) == app.MuteAd.SLEEP_AD_IDLE == 5.0
+    assert worker._next_idle_sleep(changed=False) == 7.5
@@ -0,0 +1,69 @@
+"""Shape-specialised C NCC kernels (ncc_kernels) vs OpenCV."""
+
+import os
+import glob
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('cffi')
+import ncc_kernels  # noqa: E402
+
+
+def _compiled(templates, cache_dir, monkeypatch):
+    """Build kernels into cache_dir and wait for the background compile to finish."""
+    monkeypatch.setattr(ncc_kernels, 'CACHE_DIR', str(cache_dir))
+    kernels = ncc_kernels.build(templates)
+    kernels[0]._builder.join(timeout=120)
+    if kernels[0]._builder.module is None:
+        pytest.skip("no working C compiler for cffi")
+    return kernels
+
+
+def test_kernels_agree_with_ccoeff_normed(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    templates = [rng.integers(0, 256, (h, w), dtype=np.uint8) for h, w in [(17, 76), (23, 21), (14, 79)]]
+    kernels = _compiled(templates, tmp_path, monkeypatch)
+    for template, kernel in zip(templates, kernels):
+        h, w = template.shape
+        big = rng.integers(0, 256, (h + 40, w + 40), dtype=np.uint8)
+        for window in (big[:h + 6, :w + 6], big[5:h + 12, 3:w + 9]):  # non-contiguous rows
+            score, loc = kernel(window)
+            _, expected, _, expected_loc = cv2.minMaxLoc(cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED))
+            assert abs(score - expected) < 1e-4
+            assert loc == expected_loc
+
+
+def test_kernels_find_pasted_template(tmp_path, monkeypatch):
+    template = cv2.imread(os.path.join(os.path.dirname(ncc_kernels.__file__), 'volume', 'volume.png'),
+                          cv2.IMREAD_GRAYSCALE)
+    (kernel,) = _compiled([template], tmp_path, monkeypatch)
+    h, w = template.shape
+    window = np.full((h + 4, w + 4), 24, dtype=np.uint8)
+    window[3:3 + h, 1:1 + w] = template
+    score, loc = kernel(window)
+    assert score > 0.999
+    assert loc == (1, 3)
+
+
+def test_kernels_return_none_until_compiled():
+    class Pending:
+        module = None
+    template = np.random.default_rng(1).integers(0, 256, (8, 8), dtype=np.uint8)
+    kernel = ncc_kernels._Kernel(template, Pending())
+    assert kernel(np.zeros((10, 10), dtype=np.uint8)) is None
+
+
+def test_corrupt_cached_module_is_rebuilt(tmp_path, monkeypatch, caplog):
+    template = np.random.default_rng(2).integers(0, 256, (9, 13), dtype=np.uint8)
+    _compiled([template], tmp_path / 'first', monkeypatch)
+    (built,) = [p for p in glob.glob(str(tmp_path / 'first' / '_ncc_*'))
+                if os.path.splitext(p)[1] in ('.so', '.pyd')]
+    corrupt_dir = tmp_path / 'second'
+    corrupt_dir.mkdir()
+    (corrupt_dir / os.path.basename(built)).write_bytes(b'not a shared library')
+    (kernel,) = _compiled([template], corrupt_dir, monkeypatch)
+    assert "failed to load, rebuilding" in caplog.text
+    score, loc = kernel(template)
+    assert score > 0.999 and loc == (0, 0)
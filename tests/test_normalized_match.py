@@ -0,0 +1,72 @@
+"""TM_CCORR scores normalised with load-time template stats (_normalized_match) vs OpenCV."""
+
+import cv2
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('level', [0, 1, 2])
+def test_normalized_match_agrees_with_ccoeff_normed(app, screenshot, level):
+    rng = np.random.default_rng(level)
+    haystack = screenshot(rng.integers(0, 256, (240, 320), dtype=np.uint8))
+    image = haystack.pyramid[level]
+    for h, w in [(8, 8), (14, 79), (23, 21)]:
+        if h > image.shape[0] or w > image.shape[1]:
+            continue
+        template = rng.integers(0, 256, (h, w), dtype=np.uint8)
+        ours = app._normalized_match(haystack, level, template, app.template_stats(template))
+        expected = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        assert ours.shape == expected.shape
+        np.testing.assert_allclose(ours, expected, atol=1e-4)
+
+
+def test_normalized_match_scores_flat_windows_zero(app, screenshot):
+    haystack = screenshot(np.full((60, 80), 24, dtype=np.uint8))
+    template = np.random.default_rng(0).integers(0, 256, (10, 10), dtype=np.uint8)
+    scores = app._normalized_match(haystack, 0, template, app.template_stats(template))
+    assert np.all(scores == 0)
+
+
+def test_window_stats_are_shared_per_size(app, screenshot):
+    haystack = screenshot(np.random.default_rng(0).integers(0, 256, (60, 80), dtype=np.uint8))
+    first = app._window_stats(haystack, 0, 10, 12)
+    assert app._window_stats(haystack, 0, 10, 12) is first
+
+
+def _shipped_templates(app):
+    return [t for t in [app.image_volume, app.image_mute, *app.image_ads] if t is not None]
+
+
+def test_locate_in_finds_random_placements(app, screenshot, spotify_screen):
+    """Every shipped template is found where it was pasted, without the prefilter."""
+    rng = np.random.default_rng(1234)
+    for template in _shipped_templates(app):
+        needle = template._replace(samples=None)  # exercise the pyramid / full-image paths
+        h, w = needle.image.shape
+        for _ in range(20):
+            image = spotify_screen(rng)
+            y, x = int(rng.integers(0, image.shape[0] - h + 1)), int(rng.integers(0, image.shape[1] - w + 1))
+            image[y:y + h, x:x + w] = needle.image
+            assert app.locate_in(screenshot(image), needle) == (x + w // 2, y + h // 2), needle.name
+
+
+def test_locate_in_misses_absent_template(app, screenshot, spotify_screen):
+    rng = np.random.default_rng(99)
+    for template in _shipped_templates(app):
+        assert app.locate_in(screenshot(spotify_screen(rng)), template._replace(samples=None)) is None
+
+
+def test_prefilter_and_pyramid_paths_agree(app, screenshot, text_screen):
+    """locate_in() gives the same answer whether or not the prefilter runs first."""
+    if app.image_volume.samples is None:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(7)
+    for template in _shipped_templates(app):
+        h, w = template.image.shape
+        for placed in (False, True):
+            image = text_screen(rng)
+            if placed:
+                y, x = int(rng.integers(0, image.shape[0] - h + 1)), int(rng.integers(0, image.shape[1] - w + 1))
+                image[y:y + h, x:x + w] = template.image
+            expected = app.locate_in(screenshot(image), template._replace(samples=None))
+            assert app.locate_in(screenshot(image), template) == expected, template.name